@@ -2,29 +2,78 @@ import sys
 import numpy as np
 from scipy.fft import rfftfreq, rfft, irfft
 
+try:
+    # -- rocket-fft registers np.fft.rfft/irfft for use in numba's nopython mode
+    from numba import njit
+    import rocket_fft
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+try:
+    import pyfftw
+    HAS_PYFFTW = True
+except ImportError:
+    HAS_PYFFTW = False
+
+try:
+    import cupy as cp
+    from cupyx.scipy.fft import get_fft_plan
+    HAS_CUPY = True
+except ImportError:
+    HAS_CUPY = False
+
 
 class KdVSolverBaseClass():
 
-    def __init__(self, t, x, delta, nSkip=1):
+    def __init__(self, t, x, delta, nSkip=1, dealias=False, dtype=np.float64):
         self.nSkip = nSkip
         self.delta = delta
-        self.dt = t[1]-t[0]
+        # -- dtype=np.float32 RUNS IN SINGLE PRECISION; STABLE ONLY WITH dealias=True
+        self.dtype = np.dtype(dtype)
+        if self.dtype != np.float64 and not dealias:
+            raise ValueError("dtype=%s requires dealias=True (aliasing errors blow up in single precision)"%self.dtype)
+        cdtype = np.result_type(self.dtype, np.complex64)
+        self.dt = self.dtype.type(t[1]-t[0])
         self.t = t
         self.x = x
         self.k = rfftfreq(x.size,d=x[1]-x[0])*2*np.pi
-        self._t = []
-        self._u = []
+        # -- PRECOMPUTE CONSTANT LINEAR PROPAGATORS (IN DOUBLE PRECISION)
+        g = 1j*self.k**3*delta**2
+        dt = t[1]-t[0]
+        self.g = g.astype(cdtype)
+        self._E_half = np.exp(g*dt/2).astype(cdtype)
+        self._E_full = np.exp(g*dt).astype(cdtype)
+        self._Einv_half = np.exp(-g*dt/2).astype(cdtype)
+        self._Einv_full = np.exp(-g*dt).astype(cdtype)
+        self._ik_half = (-0.5j*self.k).astype(cdtype)
+        self.k = self.k.astype(self.dtype)
+        if dealias:
+            # -- 2/3-RULE: NO NONLINEAR COUPLING INTO THE UPPER THIRD OF MODES
+            self._ik_half[self.k > 2*self.k[-1]/3] = 0.
+        # -- NONLINEAR PREFACTORS WITH BACKTRANSFORMATION TO AUX. FIELD ABSORBED
+        self._ikEinv_half = self._ik_half*self._Einv_half
+        self._ikEinv_full = self._ik_half*self._Einv_full
+        # -- REUSABLE WORKSPACE FOR RK STAGE INPUT
+        self._cbuf = np.empty(self.k.size, dtype=cdtype)
+        # -- PREALLOCATE BUFFERS FOR RECORDED FIELD (IN FOURIER SPACE)
+        nFrames = (t.size-1)//nSkip + 1
+        self._t = np.empty(nFrames, dtype=np.float64)
+        self._uk = np.empty((nFrames, self.k.size), dtype=cdtype)
 
     def solve(self, u):
-        self._t.append(self.t[0])
-        self._u.append(u)
+        u = u.astype(self.dtype, copy=False)
+        self._t[0] = self.t[0]
         uk = rfft(u)
-        for i in range(1,self.t.size):
-           uk = self.singleStep(uk)
-           if i%self.nSkip==0:
-             self._u.append(irfft(uk))
-             self._t.append(self.t[i])
-        return np.asarray(self._t), np.asarray(self._u)
+        self._uk[0] = uk
+        for frame in range(1,self._t.size):
+           for _ in range(self.nSkip):
+             uk = self.singleStep(uk)
+           self._uk[frame] = uk
+           self._t[frame] = self.t[frame*self.nSkip]
+        # -- BACKTRANSFORM ALL RECORDED FRAMES IN A SINGLE BATCHED CALL
+        self._u = irfft(self._uk, n=self.x.size, axis=-1, workers=-1)
+        return self._t, self._u
 
     def singleStep(self):
         raise NotImplementedError
@@ -32,28 +81,194 @@ class KdVSolverBaseClass():
 
 class KdVIntegratingFactorSolver(KdVSolverBaseClass):
 
+    def _dUkdt(self, Uk, E, ikEinv):
+        # -- DERIVATIVE OF AUXILIARY FIELD; OVERWRITES STAGE INPUT Uk
+        Uk *= E
+        u = irfft(Uk, overwrite_x=True)
+        np.square(u, out=u)
+        dUk = rfft(u, overwrite_x=True)
+        dUk *= ikEinv
+        return dUk
+
     def singleStep(self, uk):
 
         # -- DECLARE CONVENIENT ABBREVIATIONS
-        dt, k, delta  = self.dt, self.k, self.delta
-        g = 1j*k*k*k*delta*delta
+        dt, Uk = self.dt, self._cbuf
+        E_half, E_full = self._E_half, self._E_full
+        ikEinv_half, ikEinv_full = self._ikEinv_half, self._ikEinv_full
 
-        # -- DERIVATIVE OF AUXILIARY FIELD 
-        _dUkdt = lambda dt, uk: -0.5j*k*np.exp(-g*dt)*rfft(irfft(np.exp(g*dt)*uk)**2)
+        # -- 4TH ORDER RK METHOD FOR t-STEPPING AUX FIELD
+        np.copyto(Uk, uk)
+        k1 = self._dUkdt(Uk, 1., self._ik_half)
+        np.multiply(k1, dt/2, out=Uk); Uk += uk
+        k2 = self._dUkdt(Uk, E_half, ikEinv_half)
+        np.multiply(k2, dt/2, out=Uk); Uk += uk
+        k3 = self._dUkdt(Uk, E_half, ikEinv_half)
+        np.multiply(k3, dt, out=Uk); Uk += uk
+        k4 = self._dUkdt(Uk, E_full, ikEinv_full)
+
+        # -- ADVANCE FIELD AND TRANSFORM BACK TO ORIGINAL FIELD
+        # -- (in-place evaluation of E_full*(uk + dt*(k1 + 2*k2 + 2*k3 + k4)/6))
+        k2 += k3; k2 *= 2; k2 += k1; k2 += k4
+        k2 *= dt/6; k2 += uk; k2 *= E_full
+        return k2
+
+
+class KdVIntegratingFactorSolverFFTW(KdVIntegratingFactorSolver):
+    """integrating factor solver using precomputed pyFFTW plans
+
+    Plans for the real-to-complex transform pair of size x.size are built
+    once, upon initialization, and reused in every RK stage (requires
+    pyfftw).
+    """
+
+    def __init__(self, t, x, delta, nSkip=1, dealias=False, dtype=np.float64):
+        super().__init__(t, x, delta, nSkip, dealias, dtype)
+        # -- RK STAGE INPUT IS ASSEMBLED DIRECTLY IN THE PLAN BUFFERS
+        self._cbuf = pyfftw.empty_aligned(x.size//2+1, dtype=self._cbuf.dtype)
+        self._rbuf = pyfftw.empty_aligned(x.size, dtype=self.dtype)
+        self._rfft = pyfftw.FFTW(self._rbuf, self._cbuf,
+                                 flags=('FFTW_MEASURE',), threads=1)
+        self._irfft = pyfftw.FFTW(self._cbuf, self._rbuf,
+                                  direction='FFTW_BACKWARD', flags=('FFTW_MEASURE',), threads=1)
+
+    def _dUkdt(self, Uk, E, ikEinv):
+        # -- DERIVATIVE OF AUXILIARY FIELD; Uk IS THE PLAN BUFFER self._cbuf
+        Uk *= E
+        self._irfft()
+        np.square(self._rbuf, out=self._rbuf)
+        self._rfft()
+        return ikEinv*self._cbuf
+
+
+class KdVIntegratingFactorSolverCuPy(KdVIntegratingFactorSolver):
+    """integrating factor solver running on a CUDA device
+
+    Propagators, RK stage workspace and recorded field are kept in device
+    memory, transforms use precomputed cuFFT plans, and the recorded field
+    is downloaded once, after the time loop (requires cupy).
+    """
+
+    def __init__(self, t, x, delta, nSkip=1, dealias=False, dtype=np.float64):
+        super().__init__(t, x, delta, nSkip, dealias, dtype)
+        # -- MOVE CONSTANT PROPAGATORS AND WORKSPACE TO DEVICE
+        self._E_half, self._E_full = cp.asarray(self._E_half), cp.asarray(self._E_full)
+        self._ikEinv_half, self._ikEinv_full = cp.asarray(self._ikEinv_half), cp.asarray(self._ikEinv_full)
+        self._ik_half = cp.asarray(self._ik_half)
+        self._cbuf = cp.asarray(self._cbuf)
+        self._ukDev = cp.empty(self._uk.shape, dtype=self._uk.dtype)
+        # -- PLANS FOR THE REAL-TO-COMPLEX TRANSFORM PAIR
+        self._rfftPlan = get_fft_plan(cp.empty(x.size, dtype=self.dtype), value_type='R2C')
+        self._irfftPlan = get_fft_plan(self._cbuf, shape=(x.size,), value_type='C2R')
+
+    def _dUkdt(self, Uk, E, ikEinv):
+        # -- DERIVATIVE OF AUXILIARY FIELD; OVERWRITES STAGE INPUT Uk
+        Uk *= E
+        with self._irfftPlan:
+            u = cp.fft.irfft(Uk, self.x.size)
+        cp.square(u, out=u)
+        with self._rfftPlan:
+            dUk = cp.fft.rfft(u)
+        dUk *= ikEinv
+        return dUk
 
-        # -- AUX. FIELD TO ORIGINAL FIELD BACKTRANSFORMATION 
-        _a2o = lambda Uk: Uk*np.exp(g*dt)
+    def solve(self, u):
+        ukt = self._ukDev
+        self._t[:] = self.t[::self.nSkip]
+        with self._rfftPlan:
+            uk = cp.fft.rfft(cp.asarray(u, dtype=self.dtype))
+        ukt[0] = uk
+        for frame in range(1,self._t.size):
+           for _ in range(self.nSkip):
+             uk = self.singleStep(uk)
+           ukt[frame] = uk
+        # -- BACKTRANSFORM ALL RECORDED FRAMES ON DEVICE, DOWNLOAD ONCE
+        self._u = cp.fft.irfft(ukt, self.x.size, axis=-1).get()
+        return self._t, self._u
+
+
+def _stage_input(uk, kj, h, E, out):
+    # -- out = E*(uk + h*kj), ELEMENTWISE
+    for j in range(uk.size):
+        out[j] = E[j]*(uk[j] + h*kj[j])
+    return out
+
+
+def _rk4_update(uk, k1, k2, k3, k4, E_full, dt):
+    # -- uk = E_full*(uk + dt*(k1 + 2*k2 + 2*k3 + k4)/6), ELEMENTWISE AND IN PLACE
+    h6 = dt/6.
+    for j in range(uk.size):
+        uk[j] = E_full[j]*(uk[j] + h6*(k1[j] + 2.*k2[j] + 2.*k3[j] + k4[j]))
+    return uk
+
+
+def _nonlinearity(Uk, ikEinv, Nx):
+    # -- ikEinv*rfft(irfft(Uk)**2), SQUARE AND PREFACTOR APPLIED IN PLACE
+    u = np.fft.irfft(Uk, Nx)
+    for i in range(Nx):
+        u[i] = u[i]*u[i]
+    dUk = np.fft.rfft(u)
+    for j in range(dUk.size):
+        dUk[j] *= ikEinv[j]
+    return dUk
+
+
+def _single_step(uk, dt, ik_half, E_half, E_full, ikEinv_half, ikEinv_full, Nx, buf):
+    # -- 4TH ORDER RK METHOD FOR t-STEPPING AUX FIELD
+    k1 = _nonlinearity(uk, ik_half, Nx)
+    _stage_input(uk, k1, dt/2, E_half, buf)
+    k2 = _nonlinearity(buf, ikEinv_half, Nx)
+    _stage_input(uk, k2, dt/2, E_half, buf)
+    k3 = _nonlinearity(buf, ikEinv_half, Nx)
+    _stage_input(uk, k3, dt, E_full, buf)
+    k4 = _nonlinearity(buf, ikEinv_full, Nx)
+    # -- ADVANCE FIELD AND TRANSFORM BACK TO ORIGINAL FIELD
+    return _rk4_update(uk, k1, k2, k3, k4, E_full, dt)
+
+
+def _solve_kdv(u0, dt, ik_half, E_half, E_full, ikEinv_half, ikEinv_full, nSkip, out_uk):
+    Nx = u0.size
+    uk = np.fft.rfft(u0)
+    out_uk[0] = uk
+    buf = np.empty_like(uk)
+    for frame in range(1, out_uk.shape[0]):
+        for _ in range(nSkip):
+            uk = _single_step(uk, dt, ik_half, E_half, E_full, ikEinv_half, ikEinv_full, Nx, buf)
+        out_uk[frame] = uk
+
+
+if HAS_NUMBA:
+    _stage_input = njit(cache=True, fastmath=True, boundscheck=False)(_stage_input)
+    _rk4_update = njit(cache=True, fastmath=True, boundscheck=False)(_rk4_update)
+    _nonlinearity = njit(cache=True, fastmath=True, boundscheck=False)(_nonlinearity)
+    _single_step = njit(cache=True, fastmath=True)(_single_step)
+    _solve_kdv = njit(cache=True, fastmath=True)(_solve_kdv)
+
+
+class KdVIntegratingFactorSolverNumba(KdVIntegratingFactorSolver):
+    """integrating factor solver with the time loop compiled by numba
+
+    Runs the RK4 driver loop of KdVIntegratingFactorSolver in numba's
+    nopython mode (requires numba and rocket-fft). Without numba the same
+    code runs, uncompiled and slowly, in the interpreter.
+    """
+
+    def solve(self, u):
+        u = u.astype(self.dtype, copy=False)
+        self._t[:] = self.t[::self.nSkip]
+        _solve_kdv(u, self.dt, self._ik_half, self._E_half, self._E_full,
+                   self._ikEinv_half, self._ikEinv_full, self.nSkip, self._uk)
+        self._u = irfft(self._uk, n=self.x.size, axis=-1, workers=-1)
+        return self._t, self._u
 
-        # -- 4TH ORDER RK METHOD FOR t-STEPPING AUX FIELD
-        def _RK4(uk):
-            k1 = _dUkdt(0., uk)
-            k2 = _dUkdt(dt/2, uk + dt*k1/2)
-            k3 = _dUkdt(dt/2, uk + dt*k2/2)
-            k4 = _dUkdt(dt, uk + dt*k3)
-            return uk + dt*(k1 + 2*k2 + 2*k3 + k4)/6
 
-        # -- ADVANCE FIELD
-        return _a2o(_RK4(uk))
+def fastest_solver():
+    """fastest integrating factor solver available on this system"""
+    if HAS_NUMBA:
+        return KdVIntegratingFactorSolverNumba
+    if HAS_PYFFTW:
+        return KdVIntegratingFactorSolverFFTW
+    return KdVIntegratingFactorSolver
 
 
 def main_generate_data():
@@ -69,7 +284,7 @@ def main_generate_data():
     t = np.linspace(tMin, tMax, Nt, endpoint=True)
 
     # -- INITIALIZE SOLVER
-    KdVSolver = KdVIntegratingFactorSolver(t, x, delta, nSkip)
+    KdVSolver = fastest_solver()(t, x, delta, nSkip)
 
     # -- SET INITIAL CONDITION 
     ux0  = np.cos(x*np.pi)
@@ -77,8 +292,8 @@ def main_generate_data():
     # -- PROPAGATE FIELD
     _t, uxt = KdVSolver.solve(ux0)
 
-    # -- SAVE RECORDED FIELD
-    np.savez_compressed('KdV_raw_data.npz', t=_t, x=x, uxt=uxt, delta=delta)
+    # -- SAVE RECORDED FIELD (UNCOMPRESSED; DEFLATE BARELY SHRINKS FLOAT64 DATA)
+    np.savez('KdV_raw_data.npz', t=_t, x=x, uxt=uxt, delta=delta)
 
 
 def main_show_figures():
@@ -94,7 +309,7 @@ def main_show_figures():
     t = np.linspace(tMin, tMax, Nt, endpoint=True)
 
     # -- INITIALIZE SOLVER
-    KdVSolver = KdVIntegratingFactorSolver(t, x, delta, nSkip)
+    KdVSolver = fastest_solver()(t, x, delta, nSkip)
 
     # -- SET INITIAL CONDITION 
     ux0  = np.cos(x*np.pi)
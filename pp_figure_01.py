@@ -15,6 +15,10 @@ at Institute of Quantum Optics at Leibniz University Hannover.
 Author: O. Melchert
 Date: 2020-09-08
 """
+import os
+import time
+import zipfile
+import functools
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
@@ -23,42 +27,144 @@ from matplotlib.gridspec import GridSpec
 __author__ = 'Oliver Melchert'
 __date__ = '2020-09-09'
 
-def fetch_data(path):
+# -- LaTeX text rendering is slow; enable it by setting PP_USETEX=1
+USE_TEX = os.environ.get('PP_USETEX', '0') == '1'
+
+# -- resolution (dots per inch) for figures saved in raster-capable formats
+# -- (300 dpi gives 1020 px across a 3.4 in PRL column, plenty for print)
+SAVE_DPI = 300
+
+def _npz_memmap(path, name, mode='r'):
+    """npz memmap
+
+    Memory-maps an array stored uncompressed (np.savez) in a npz-file,
+    so that only the parts actually accessed are read from disk. The
+    array data is located by skipping the zip local file header of the
+    member and parsing its npy header, see [1].
+
+    Refs:
+      [1] https://numpy.org/doc/stable/reference/generated/numpy.lib.format.html
+
+    Args:
+      path (str): path to npz-file
+      name (str): name of the array in the npz-file
+      mode (str): mode for np.memmap, 'r' (read-only) or 'c' (copy-on-write);
+                  modes writing to the file would corrupt the npz-file
+                  (default: 'r')
+
+    Returns: memory-mapped array, or None if the member is compressed
+    """
+    if mode not in ('r', 'c'):
+        raise ValueError("mode must be 'r' or 'c', got %r"%(mode,))
+    with zipfile.ZipFile(path) as zf:
+        info = zf.getinfo(name + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(path, 'rb') as fh:
+        # -- skip 30 byte local file header, file name and extra field
+        fh.seek(info.header_offset)
+        hdr = fh.read(30)
+        fh.seek(info.header_offset + 30 + int.from_bytes(hdr[26:28], 'little')
+                + int.from_bytes(hdr[28:30], 'little'))
+        version = np.lib.format.read_magic(fh)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fh)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fh)
+        offset = fh.tell()
+    return np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def fetch_data(path, mmap_mode=None):
     """fetch data
 
     Reads in data from file in numpy npz-format
 
+    Note:
+    - with mmap_mode set, the field uxt is memory-mapped instead of read
+      into memory, provided the file was written uncompressed (np.savez);
+      otherwise it is read as usual
+
     Args:
       path (str): path to npz-file
+      mmap_mode (str): mode for memory-mapping uxt, 'r' or 'c' (default: None)
 
     Returns: (x, t, uxt)
       x (1D array): x samples
       t (1D array): t samples
       uxt (2D array): wave profile u(x,t)
     """
-    dat = np.load(path)
-    return dat['x'], dat['t'], dat['uxt']
+    with np.load(path) as dat:
+        x, t = dat['x'], dat['t']
+        uxt = _npz_memmap(path, 'uxt', mmap_mode) if mmap_mode else None
+        if uxt is None:
+            uxt = dat['uxt']
+    return x, t, uxt
 
 
-def set_style():
-    """set figure style
+def closest_index(t, t0):
+    """closest index
 
-    Function that customizes the default style to be conform with the Physical
-    Review style and notation guide [1]. For instructions on how to set the
-    default style using style sheets see [2].
+    Index of the sample in the monotonically increasing array t that is
+    closest to t0, found by binary search (ties resolve to the lower index)
+
+    Args:
+      t (1D array): increasing samples
+      t0 (float or 1D array): target value(s)
+
+    Returns:
+      idx (int or 1D array): index (indices) of closest sample(s)
+    """
+    i = np.clip(np.searchsorted(t, t0), 1, len(t)-1)
+    return np.where(t0 - t[i-1] <= t[i] - t0, i-1, i)
+
+
+def _tex_cache_gc(max_age_days=30):
+    """prune tex cache
+
+    Removes files older than max_age_days from matplotlib's cache of
+    LaTeX-rendered text, so that the cache does not grow without bound.
+
+    Args:
+      max_age_days (float): max. age of cached files in days (default: 30)
+    """
+    cache_dir = os.path.join(mpl.get_cachedir(), 'tex.cache')
+    t_min = time.time() - max_age_days*24*3600
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.getmtime(path) < t_min:
+                os.remove(path)
+
+
+@functools.lru_cache(maxsize=1)
+def _style_params():
+    """style parameters
+
+    Function that assembles rc settings customizing the default style to be
+    conform with the Physical Review style and notation guide [1]. For
+    instructions on how to set the default style using style sheets see [2].
 
     Notes:
     - main font size is chosen as 8pt, matching the fontsize of figure captions
     - fontsize of legends and auxiliary text labels are set to 6pt, exceeding
       the minimally required pointsize of 4.25 pt. (1.5 mm)
-    - default rc (rc = "run commands", i.e. startup information) settings are
-      changed dynamically
+    - the rc (rc = "run commands", i.e. startup information) settings are
+      assembled only once and cached; set_style applies them
     - the custom font-scheme 'type2' depends on your latex installation and
       is not guaranteed to run on your specific system
+    - unless LaTeX rendering is enabled via the environment variable
+      PP_USETEX=1, font-scheme 'type2' falls back to matplotlib's mathtext
+    - LaTeX-rendered text is cached by matplotlib across runs; stale cache
+      entries are pruned when LaTeX rendering is enabled
 
     Refs:
       [1] https://journals.aps.org/prl/authors
       [2] https://matplotlib.org/3.3.1/tutorials/introductory/customizing.html
+
+    Returns:
+      rc (dict): rc settings
     """
 
     fig_width_1col = 3.4        # figure width in inch
@@ -71,38 +177,57 @@ def set_style():
                                 #   'type1' - text: Helvetica, math: Computer modern
                                 #   'type2' - text: Helvetica, math: Helvetica 
 
-    mpl.rcParams['figure.figsize'] = fig_width_1col, fig_aspect_ratio*fig_width_1col
-    mpl.rcParams['axes.labelsize'] = font_size
-    mpl.rcParams['font.size'] = font_size
-    mpl.rcParams['legend.fontsize'] = font_size_small
-    mpl.rcParams['xtick.labelsize'] = font_size
-    mpl.rcParams['ytick.labelsize'] = font_size
-    mpl.rcParams['xtick.direction'] = 'out'
-    mpl.rcParams['ytick.direction'] = 'out'
-    mpl.rcParams['lines.linewidth'] = 1.0
-    mpl.rcParams['axes.linewidth'] =  0.5
+    rc = {
+        'figure.figsize': (fig_width_1col, fig_aspect_ratio*fig_width_1col),
+        'axes.labelsize': font_size,
+        'font.size': font_size,
+        'legend.fontsize': font_size_small,
+        'xtick.labelsize': font_size,
+        'ytick.labelsize': font_size,
+        'xtick.direction': 'out',
+        'ytick.direction': 'out',
+        'lines.linewidth': 1.0,
+        'axes.linewidth': 0.5,
+    }
 
     if font_scheme == 'type1':
-        mpl.rcParams['text.usetex'] = True
-        mpl.rcParams['font.family'] = 'sans-serif'
-        mpl.rcParams['font.sans-serif'] = 'Helvetica'
-        mpl.rcParams['mathtext.fontset'] = 'cm'
-
-    if font_scheme == 'type2':
-        mpl.rcParams['text.usetex'] = True
-        mpl.rcParams['text.latex.preamble'] = [
+        rc['text.usetex'] = True
+        rc['font.family'] = 'sans-serif'
+        rc['font.sans-serif'] = 'Helvetica'
+        rc['mathtext.fontset'] = 'cm'
+
+    if font_scheme == 'type2' and not USE_TEX:
+        rc['text.usetex'] = False
+        rc['mathtext.fontset'] = 'cm'
+
+    if font_scheme == 'type2' and USE_TEX:
+        _tex_cache_gc()
+        rc['text.usetex'] = True
+        rc['text.latex.preamble'] = '\n'.join([
            r'\usepackage{siunitx}',
            r'\sisetup{detect-all}',
            r'\usepackage{helvet}',
            r'\usepackage{sansmath}',
            r'\sansmath'
-        ]
+        ])
+    return rc
+
+
+def set_style():
+    """set figure style
+
+    Function that customizes the default style to be conform with the Physical
+    Review style and notation guide, see _style_params. The settings are
+    applied in a single rcParams update.
+    """
+    mpl.rcParams.update(_style_params())
 
 
-def set_circle(ax, x0, y0, label):
-    """set circle
+def set_circles(ax, xs, ys, labels):
+    """set circles
 
-    Function that generates a circle with text-label at its center.
+    Function that generates circles with text-labels at their centers.
+    All circles are drawn by a single scatter plot object.
     For more options on scatter plots, see [1], for more options on
     setting text, see [2]
 
@@ -111,15 +236,17 @@ def set_circle(ax, x0, y0, label):
       [2] https://matplotlib.org/3.1.1/api/_as_gen/matplotlib.pyplot.text.html
 
     Args:
-      ax (object): figure part for which the labeled circle is intended
-      x0 (float): x-position for center of circle
-      y0 (float): y-position for center of circle
-      label (str): text that should be displayed within circle
+      ax (object): figure part for which the labeled circles are intended
+      xs (1D array): x-positions for centers of circles
+      ys (1D array or float): y-positions for centers of circles
+      labels (list): texts that should be displayed within circles
     """
-    # -- scatter plot consisting of a single object
-    ax.scatter(x0, y0, s=50, linewidth=0.75, facecolors='none', edgecolor='black', zorder=10)
-    # -- place text at the center of the scatter plot object
-    ax.text(x0, y0, label, backgroundcolor='none', ha='center', va='center', color='black', zorder=10, fontsize=6)
+    xs, ys = np.broadcast_arrays(xs, ys)
+    # -- single scatter plot object holding all circles
+    ax.scatter(xs, ys, s=50, linewidth=0.75, facecolors='none', edgecolor='black', zorder=10)
+    # -- place texts at the centers of the scatter plot objects
+    for x0, y0, label in zip(xs, ys, labels):
+        ax.text(x0, y0, label, backgroundcolor='none', ha='center', va='center', color='black', zorder=10, fontsize=6)
 
 
 def set_legend(ax, lines):
@@ -183,9 +310,9 @@ def save_figure(fig_format = None, fig_name = 'test'):
       fig_name (str): name for figure (default: 'test')
     """
     if fig_format == 'png':
-        plt.savefig(fig_name+'.png', format='png', dpi=600)
+        plt.savefig(fig_name+'.png', format='png', dpi=SAVE_DPI)
     elif fig_format == 'pdf':
-        plt.savefig(fig_name+'.pdf', format='pdf', dpi=600)
+        plt.savefig(fig_name+'.pdf', format='pdf', dpi=SAVE_DPI)
     elif fig_format == 'svg':
         plt.savefig(fig_name+'.svg', format='svg')
     else:
@@ -228,7 +355,7 @@ def generate_figure(x, t, uxt, fig_format=None, fig_name='fig01'):
     # (3) SET AXES CONTENTS
     # -- custom constants and local functions
     tB = 1./np.pi                                   # breakdown time
-    _ux = lambda t0: uxt[np.argmin(np.abs(t-t0))]   # wave form for array index closest to t0 
+    _ux = lambda t0: uxt[closest_index(t, t0)]      # wave form for array index closest to t0 
 
     # -- plot real-vaued field at selected times 
     l1 = ax01.plot(x, _ux(0.0),    color='blue',  dashes=[1,1], zorder=100, label=r'$t=0$')
@@ -260,8 +387,8 @@ def generate_figure(x, t, uxt, fig_format=None, fig_name='fig01'):
                     dashes = [15,1,2,1,2,1], linewidth=0.75)
 
     # -- set circles with labels
-    for  idx, x0 in enumerate([0.643, 0.362, 0.098, 0.920, 1.14, 1.37, 1.6, 1.845]):
-        set_circle(ax01, x0, _f(x0) + 0.2, '$%d$'%(idx+1))
+    xs = np.array([0.643, 0.362, 0.098, 0.920, 1.14, 1.37, 1.6, 1.845])
+    set_circles(ax01, xs, _f(xs) + 0.2, ['$%d$'%(idx+1) for idx in range(len(xs))])
 
     # (4) SET AXIS DETAILS
     # -- customize x-axis
@@ -308,10 +435,15 @@ def generate_figure(x, t, uxt, fig_format=None, fig_name='fig01'):
 
     # (6) SAVE FIGURE
     save_figure(fig_format, fig_name)
+    if fig_format is not None:
+        # -- free canvas buffers right away instead of relying on GC
+        plt.close(fig)
 
 
 def main():
-    x, t, uxt = fetch_data('KdV_raw_data.npz')
+    x, t, uxt = fetch_data('KdV_raw_data.npz', mmap_mode='r')
+    # -- batch mode: render off-screen, no GUI canvas/window setup
+    plt.switch_backend('Agg')
     generate_figure(x, t, uxt, fig_format='png', fig_name='fig01')
 
 
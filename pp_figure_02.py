@@ -15,50 +15,160 @@ at Institute of Quantum Optics at Leibniz University Hannover.
 Author: O. Melchert
 Date: 2020-09-09
 """
+import os
+import time
+import zipfile
+import functools
 import numpy as np
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 from matplotlib.gridspec import GridSpec
+from matplotlib.collections import LineCollection
 
 __author__ = 'Oliver Melchert'
 __date__ = '2020-09-09'
 
-def fetch_data(path):
+# -- LaTeX text rendering is slow; enable it by setting PP_USETEX=1
+USE_TEX = os.environ.get('PP_USETEX', '0') == '1'
+
+# -- resolution (dots per inch) for figures saved in raster-capable formats
+# -- (300 dpi gives 1020 px across a 3.4 in PRL column, plenty for print)
+SAVE_DPI = 300
+
+# -- colormap for the field u(x,t), looked up once
+_CMAP = mpl.colormaps['coolwarm']
+
+def _npz_memmap(path, name, mode='r'):
+    """npz memmap
+
+    Memory-maps an array stored uncompressed (np.savez) in a npz-file,
+    so that only the parts actually accessed are read from disk. The
+    array data is located by skipping the zip local file header of the
+    member and parsing its npy header, see [1].
+
+    Refs:
+      [1] https://numpy.org/doc/stable/reference/generated/numpy.lib.format.html
+
+    Args:
+      path (str): path to npz-file
+      name (str): name of the array in the npz-file
+      mode (str): mode for np.memmap, 'r' (read-only) or 'c' (copy-on-write);
+                  modes writing to the file would corrupt the npz-file
+                  (default: 'r')
+
+    Returns: memory-mapped array, or None if the member is compressed
+    """
+    if mode not in ('r', 'c'):
+        raise ValueError("mode must be 'r' or 'c', got %r"%(mode,))
+    with zipfile.ZipFile(path) as zf:
+        info = zf.getinfo(name + '.npy')
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(path, 'rb') as fh:
+        # -- skip 30 byte local file header, file name and extra field
+        fh.seek(info.header_offset)
+        hdr = fh.read(30)
+        fh.seek(info.header_offset + 30 + int.from_bytes(hdr[26:28], 'little')
+                + int.from_bytes(hdr[28:30], 'little'))
+        version = np.lib.format.read_magic(fh)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fh)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fh)
+        offset = fh.tell()
+    return np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=shape,
+                     order='F' if fortran_order else 'C')
+
+
+def fetch_data(path, mmap_mode=None):
     """fetch data
 
     Reads in data from file in numpy npz-format
 
+    Note:
+    - with mmap_mode set, the field uxt is memory-mapped instead of read
+      into memory, provided the file was written uncompressed (np.savez);
+      otherwise it is read as usual
+
     Args:
       path (str): path to npz-file
+      mmap_mode (str): mode for memory-mapping uxt, 'r' or 'c' (default: None)
 
     Returns: (x, t, uxt)
       x (1D array): x samples
       t (1D array): t samples
       uxt (2D array): wave profile u(x,t)
     """
-    dat = np.load(path)
-    return dat['x'], dat['t'], dat['uxt']
+    with np.load(path) as dat:
+        x, t = dat['x'], dat['t']
+        uxt = _npz_memmap(path, 'uxt', mmap_mode) if mmap_mode else None
+        if uxt is None:
+            uxt = dat['uxt']
+    return x, t, uxt
 
 
-def set_style():
-    """set figure style
+def closest_index(t, t0):
+    """closest index
 
-    Function that customizes the default style to be conform with the Physical
-    Review style and notation guide [1]. For instructions on how to set the
-    default style using style sheets see [2].
+    Index of the sample in the monotonically increasing array t that is
+    closest to t0, found by binary search (ties resolve to the lower index)
+
+    Args:
+      t (1D array): increasing samples
+      t0 (float or 1D array): target value(s)
+
+    Returns:
+      idx (int or 1D array): index (indices) of closest sample(s)
+    """
+    i = np.clip(np.searchsorted(t, t0), 1, len(t)-1)
+    return np.where(t0 - t[i-1] <= t[i] - t0, i-1, i)
+
+
+def _tex_cache_gc(max_age_days=30):
+    """prune tex cache
+
+    Removes files older than max_age_days from matplotlib's cache of
+    LaTeX-rendered text, so that the cache does not grow without bound.
+
+    Args:
+      max_age_days (float): max. age of cached files in days (default: 30)
+    """
+    cache_dir = os.path.join(mpl.get_cachedir(), 'tex.cache')
+    t_min = time.time() - max_age_days*24*3600
+    for root, _, files in os.walk(cache_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.getmtime(path) < t_min:
+                os.remove(path)
+
+
+@functools.lru_cache(maxsize=1)
+def _style_params():
+    """style parameters
+
+    Function that assembles rc settings customizing the default style to be
+    conform with the Physical Review style and notation guide [1]. For
+    instructions on how to set the default style using style sheets see [2].
 
     Notes:
     - main font size is chosen as 8pt, matching the fontsize of figure captions
     - fontsize of legends and auxiliary text labels are set to 6pt, exceeding
       the minimally required pointsize of 4.25 pt. (1.5 mm)
-    - default rc (rc = "run commands", i.e. startup information) settings are
-      changed dynamically
+    - the rc (rc = "run commands", i.e. startup information) settings are
+      assembled only once and cached; set_style applies them
     - the custom font-scheme 'type2' depends on your latex installation and
       is not guaranteed to run on your specific system
+    - unless LaTeX rendering is enabled via the environment variable
+      PP_USETEX=1, font-scheme 'type2' falls back to matplotlib's mathtext
+    - LaTeX-rendered text is cached by matplotlib across runs; stale cache
+      entries are pruned when LaTeX rendering is enabled
 
     Refs:
       [1] https://journals.aps.org/prl/authors
       [2] https://matplotlib.org/3.3.1/tutorials/introductory/customizing.html
+
+    Returns:
+      rc (dict): rc settings
     """
 
     fig_width_1col = 3.4        # figure width in inch
@@ -71,38 +181,57 @@ def set_style():
                                 #   'type1' - text: Helvetica, math: Computer modern
                                 #   'type2' - text: Helvetica, math: Helvetica 
 
-    mpl.rcParams['figure.figsize'] = fig_width_1col, fig_aspect_ratio*fig_width_1col
-    mpl.rcParams['axes.labelsize'] = font_size
-    mpl.rcParams['font.size'] = font_size
-    mpl.rcParams['legend.fontsize'] = font_size_small
-    mpl.rcParams['xtick.labelsize'] = font_size
-    mpl.rcParams['ytick.labelsize'] = font_size
-    mpl.rcParams['xtick.direction'] = 'out'
-    mpl.rcParams['ytick.direction'] = 'out'
-    mpl.rcParams['lines.linewidth'] = 1.0
-    mpl.rcParams['axes.linewidth'] =  0.5
+    rc = {
+        'figure.figsize': (fig_width_1col, fig_aspect_ratio*fig_width_1col),
+        'axes.labelsize': font_size,
+        'font.size': font_size,
+        'legend.fontsize': font_size_small,
+        'xtick.labelsize': font_size,
+        'ytick.labelsize': font_size,
+        'xtick.direction': 'out',
+        'ytick.direction': 'out',
+        'lines.linewidth': 1.0,
+        'axes.linewidth': 0.5,
+    }
 
     if font_scheme == 'type1':
-        mpl.rcParams['text.usetex'] = True
-        mpl.rcParams['font.family'] = 'sans-serif'
-        mpl.rcParams['font.sans-serif'] = 'Helvetica'
-        mpl.rcParams['mathtext.fontset'] = 'cm'
-
-    if font_scheme == 'type2':
-        mpl.rcParams['text.usetex'] = True
-        mpl.rcParams['text.latex.preamble'] = [
+        rc['text.usetex'] = True
+        rc['font.family'] = 'sans-serif'
+        rc['font.sans-serif'] = 'Helvetica'
+        rc['mathtext.fontset'] = 'cm'
+
+    if font_scheme == 'type2' and not USE_TEX:
+        rc['text.usetex'] = False
+        rc['mathtext.fontset'] = 'cm'
+
+    if font_scheme == 'type2' and USE_TEX:
+        _tex_cache_gc()
+        rc['text.usetex'] = True
+        rc['text.latex.preamble'] = '\n'.join([
            r'\usepackage{siunitx}',
            r'\sisetup{detect-all}',
            r'\usepackage{helvet}',
            r'\usepackage{sansmath}',
            r'\sansmath'
-        ]
+        ])
+    return rc
+
 
+def set_style():
+    """set figure style
 
-def set_circle(ax, x0, y0, label):
-    """set circle
+    Function that customizes the default style to be conform with the Physical
+    Review style and notation guide, see _style_params. The settings are
+    applied in a single rcParams update.
+    """
+    mpl.rcParams.update(_style_params())
 
-    Function that generates a circle with text-label at its center.
+
+def set_circles(ax, xs, ys, labels):
+    """set circles
+
+    Function that generates circles with text-labels at their centers.
+    All circles are drawn by a single scatter plot object.
     For more options on scatter plots, see [1], for more options on
     setting text, see [2]
 
@@ -111,15 +240,17 @@ def set_circle(ax, x0, y0, label):
       [2] https://matplotlib.org/3.1.1/api/_as_gen/matplotlib.pyplot.text.html
 
     Args:
-      ax (object): figure part for which the labeled circle is intended
-      x0 (float): x-position for center of circle
-      y0 (float): y-position for center of circle
-      label (str): text that should be displayed within circle
+      ax (object): figure part for which the labeled circles are intended
+      xs (1D array): x-positions for centers of circles
+      ys (1D array or float): y-positions for centers of circles
+      labels (list): texts that should be displayed within circles
     """
-    # -- scatter plot consisting of a single object
-    ax.scatter(x0, y0, s=60, linewidth=0.75, facecolors='white', edgecolor='black', zorder=10)
-    # -- place text at the center of the scatter plot object
-    ax.text(x0, y0, label, backgroundcolor='none', ha='center', va='center', color='black', zorder=11, fontsize=6)
+    xs, ys = np.broadcast_arrays(xs, ys)
+    # -- single scatter plot object holding all circles
+    ax.scatter(xs, ys, s=60, linewidth=0.75, facecolors='white', edgecolor='black', zorder=10)
+    # -- place texts at the centers of the scatter plot objects
+    for x0, y0, label in zip(xs, ys, labels):
+        ax.text(x0, y0, label, backgroundcolor='none', ha='center', va='center', color='black', zorder=11, fontsize=6)
 
 
 def set_colorbar(fig, img, ax):
@@ -234,16 +365,138 @@ def save_figure(fig_format = None, fig_name = 'test'):
       fig_name (str): name for figure (default: 'test')
     """
     if fig_format == 'png':
-        plt.savefig(fig_name+'.png', format='png', dpi=600)
+        plt.savefig(fig_name+'.png', format='png', dpi=SAVE_DPI)
     elif fig_format == 'pdf':
-        plt.savefig(fig_name+'.pdf', format='pdf', dpi=600)
+        plt.savefig(fig_name+'.pdf', format='pdf', dpi=SAVE_DPI)
     elif fig_format == 'svg':
         plt.savefig(fig_name+'.svg', format='svg')
     else:
         plt.show()
 
 
-def generate_figure(x, t, uxt, fig_format=None, fig_name='fig02'):
+def cell_edges(z):
+    """cell edges
+
+    Edges of the cells centered at the samples z, placed midway between
+    neighboring samples and half a spacing beyond the outermost samples
+
+    Args:
+      z (1D array): sample positions (at least two)
+
+    Returns:
+      ze (1D array): cell edges, one more than samples in z
+    """
+    return np.concatenate(([z[0]-0.5*(z[1]-z[0])], 0.5*(z[:-1]+z[1:]), [z[-1]+0.5*(z[-1]-z[-2])]))
+
+
+def _trace_soliton_kernel(uxt, lo, w):
+    """trace soliton kernel
+
+    Loop-based variant of the peak tracing in trace_soliton, using a
+    hand-written argmax over the (possibly wrapping) window [lo, lo+w).
+    Intended for compilation by numba; the strict comparison picks the
+    first maximum, just as np.argmax does.
+
+    Note:
+    - the loop over time samples is inherently serial, since the window
+      for sample i is shifted by the peak found at sample i-1
+
+    Args:
+      uxt (2D array): wave profile u(x,t)
+      lo (int): lower index of initial search window
+      w (int): width of search window
+
+    Returns: (x_idx, a)
+      x_idx (1D array): x-index of the traced peak for each t sample
+      a (1D array): amplitude of the traced peak for each t sample
+    """
+    nt, nx = uxt.shape
+    x_idx = np.zeros(nt, dtype=np.int64)
+    a = np.zeros(nt); a[0] = 1
+    for i in range(1, nt):
+        lo = lo % nx
+        j = lo
+        best = uxt[i, lo]
+        for jj in range(lo + 1, lo + w):
+            jw = jj if jj < nx else jj - nx
+            if uxt[i, jw] > best:
+                best = uxt[i, jw]
+                j = jw
+        x_idx[i] = j
+        a[i] = best
+        lo += min(abs(x_idx[i]-x_idx[i-1]), abs(x_idx[i]-x_idx[-1]+nx))
+    return x_idx, a
+
+
+@functools.lru_cache(maxsize=1)
+def _compiled_trace_soliton_kernel():
+    """compiled trace soliton kernel
+
+    Imports numba only when first needed and compiles _trace_soliton_kernel
+
+    Returns: compiled kernel, or None if numba is not available
+    """
+    try:
+        from numba import njit
+    except ImportError:
+        return None
+    return njit(cache=True, fastmath=True, boundscheck=False)(_trace_soliton_kernel)
+
+
+# -- MINIMAL NUMBER OF TIME SAMPLES FOR WHICH THE COMPILED KERNEL PAYS OFF
+# -- (IMPORTING NUMBA AND LOADING THE KERNEL COSTS ~1s, THE NUMPY LOOP TAKES
+# -- ~4us PER TIME SAMPLE)
+TRACE_JIT_MIN_ROWS = 250000
+
+
+def trace_soliton(uxt, x):
+    """trace soliton
+
+    Function tracing the amplitude peak of the soliton located at x=0 at
+    the initial time. The peak search is restricted to a window of indices
+    [lo, lo+w) that follows the soliton through the periodic x-domain;
+    if the window wraps around the boundary it is searched in two slices.
+
+    Note:
+    - if uxt has at least TRACE_JIT_MIN_ROWS time samples and numba is
+      available, the compiled _trace_soliton_kernel is used instead; numba
+      is imported only then
+
+    Args:
+      uxt (2D array): wave profile u(x,t)
+      x (1D array): x samples
+
+    Returns: (x_idx, a)
+      x_idx (1D array): x-index of the traced peak for each t sample
+      a (1D array): amplitude of the traced peak for each t sample
+    """
+    nt, nx = uxt.shape
+    # -- initial window covers x>1.8 and x<0.2 (x sorted: binary search)
+    lo = int(np.searchsorted(x, 1.8, side='right'))
+    w = int(nx - lo + np.searchsorted(x, 0.2, side='left'))
+    if nt >= TRACE_JIT_MIN_ROWS:
+        kernel = _compiled_trace_soliton_kernel()
+        if kernel is not None:
+            return kernel(np.ascontiguousarray(uxt), lo, w)
+    x_idx = np.zeros(nt, dtype=np.int64)
+    a = np.zeros(nt); a[0] = 1
+    for i in range(1, nt):
+        row = uxt[i]    # view on the current time slice, no copy
+        lo = lo % nx
+        hi = lo + w
+        if hi <= nx:
+            j = lo + np.argmax(row[lo:hi])
+        else:
+            j1 = lo + np.argmax(row[lo:])
+            j2 = np.argmax(row[:hi-nx])
+            j = j1 if row[j1] >= row[j2] else j2
+        x_idx[i] = j
+        a[i] = row[j]
+        lo += min(abs(x_idx[i]-x_idx[i-1]), abs(x_idx[i]-x_idx[-1]+nx))
+    return x_idx, a
+
+
+def generate_figure(x, t, uxt, fig_format=None, fig_name='fig02', max_rows=None, trace=True):
     """generate figure
 
     Function generating a figure reproducing FIG. 2 of [1].
@@ -260,6 +513,12 @@ def generate_figure(x, t, uxt, fig_format=None, fig_name='fig02'):
       fig_format (str): format for output figure
                         (choices: png, pdf, svg; default: interactive figure)
       fig_name (str): name for output figure wihtout suffix (default='fig02')
+      max_rows (int): max. number of t samples used for the image of u(x,t);
+                      soliton tracing always uses all samples
+                      (default: None, i.e. limited by pixel resolution only)
+      trace (bool): trace 1st soliton and show its amplitude in subplot (b);
+                    if False, tracing is skipped and subplot (a) uses the full
+                    figure width (default: True)
     """
 
     # (1) SET A STYLE THAT FITS THE TARGET JOURNAL
@@ -275,41 +534,69 @@ def generate_figure(x, t, uxt, fig_format=None, fig_name='fig02'):
                         hspace = 0.05   # vertical space between subplots
                         )
     gs00 = GridSpec(nrows = 1, ncols = 6)   # set geometry of subplot grid
-    ax01 = fig.add_subplot(gs00[0, 0:5])
+    ax01 = fig.add_subplot(gs00[0, 0:5] if trace else gs00[0, :])
     ax02 = fig.add_subplot(gs00[0, 5])
+    ax02.set_visible(trace)
 
 
     # (3.1) SUBPLOT 1 - SET AXES CONTENTS
     tR = 30.4/np.pi
     t = t/tR
-    img = ax01.pcolorfast(x, t, uxt[:-1,:-1],
-                          vmin=-2., vmax=2.,                    # set color range
-                          cmap = mpl.cm.get_cmap('coolwarm')    # set colormap
+    # -- decimate field to the pixel resolution of the image only (strided views)
+    dpi = SAVE_DPI if fig_format in ('png', 'pdf') else fig.dpi
+    pos, (w_in, h_in) = ax01.get_position(), fig.get_size_inches()
+    sx = max(1, len(x)//int(pos.width*w_in*dpi))
+    st = max(1, len(t)//int(pos.height*h_in*dpi))
+    if max_rows is not None:
+        st = max(st, int(np.ceil(len(t)/max_rows)))
+    uxt_d, x_d, t_d = uxt[::st, ::sx], x[::sx], t[::st]
+    # -- samples sit at cell centers; edges give the full field its own cell each
+    x_e, t_e = cell_edges(x_d), cell_edges(t_d)
+    _uniform = lambda z: np.allclose(np.diff(z), z[1]-z[0])
+    cmap, norm = _CMAP, mpl.colors.Normalize(vmin=-2., vmax=2.)
+    if _uniform(x_d) and _uniform(t_d):
+        # -- uniform grid: map field to colors via a uint8 RGBA lookup table,
+        # -- binned exactly as the colormap does it, and draw it as image
+        lut = cmap(np.arange(cmap.N), bytes=True)
+        idx = norm(uxt_d).filled(0.)*cmap.N
+        img = ax01.imshow(lut[np.clip(idx, 0, cmap.N-1).astype(np.intp)],
+                          extent = (x_e[0], x_e[-1], t_e[0], t_e[-1]), # uniform grid
+                          origin = 'lower',                     # t increases upwards
+                          aspect = 'auto',                      # fill axes
+                          interpolation = 'nearest'             # no resampling filter
                           )
-    set_colorbar(fig, img, ax01)
-
-    # -- add auxiliary horizontal lines
-    for t0 in [0.5,1./3,1./4,1./5,1./6]:
-        ax01.axhline(t0, color = 'black', dashes = [2,2], linewidth = 1)
-
-    # -- add dashed circles
-    ax01.scatter(0.45, 0.5,     # position in data coordinates 
-                s = 1400,       # symbol size in pts.-squared
+    else:
+        # -- non-uniform grid: let pcolorfast pick a suitable rendering path
+        img = ax01.pcolorfast(x_e, t_e, uxt_d,
+                              norm = norm,                  # set color range
+                              cmap = cmap                   # set colormap
+                              )
+    # -- keep the mesh a single raster image in vector output (pdf, svg)
+    img.set_rasterized(True)
+    # -- colorbar from a scalar mappable carrying colormap and color range
+    set_colorbar(fig, mpl.cm.ScalarMappable(norm=norm, cmap=cmap), ax01)
+
+    # -- add auxiliary horizontal lines (single line collection; x in axes
+    # -- coordinates, y in data coordinates, just as for axhline)
+    t0s = np.array([0.5,1./3,1./4,1./5,1./6])
+    segs = [[(0., t0), (1., t0)] for t0 in t0s]
+    ax01.add_collection(LineCollection(segs, colors='black', linestyles=(0,(2,2)), linewidths=1,
+                                       transform=ax01.get_yaxis_transform()), autolim=False)
+
+    # -- add dashed circles (single scatter plot object)
+    ax01.scatter([0.45, 1.90, 1.67, 1.23, 0.98, 0.83],  # x-positions in data coordinates
+                 [0.5, 0.4, 1./3, 1./4, 1./5, 1./6],    # y-positions in data coordinates
+                s = [1400, 600, 600, 400, 400, 200],    # symbol sizes in pts.-squared
                 fc = 'None',    # facecolor
                 ec = 'black',   # edgecolor
                 lw = 1,         # linewidth
                 ls = '--',      # linestyle
                 zorder = 100    # layering order
                 )
-    ax01.scatter(1.90, 0.4,  s=600,  lw=1, fc='None', ec='black', ls='--', zorder=100)
-    ax01.scatter(1.67, 1./3, s=600,  lw=1, fc='None', ec='black', ls='--', zorder=100)
-    ax01.scatter(1.23, 1./4, s=400,  lw=1, fc='None', ec='black', ls='--', zorder=100)
-    ax01.scatter(0.98, 1./5, s=400,  lw=1, fc='None', ec='black', ls='--', zorder=100)
-    ax01.scatter(0.83, 1./6, s=200,  lw=1, fc='None', ec='black', ls='--', zorder=100)
 
     # -- add numbered circles
-    for idx, x0 in enumerate([0.59, 0.33, 0.1, 1.86, 1.64, 1.43, 1.23, 1.02, 0.82]):
-      set_circle(ax01, x0, 0.11, r"$%d$"%(idx+1))
+    xs = np.array([0.59, 0.33, 0.1, 1.86, 1.64, 1.43, 1.23, 1.02, 0.82])
+    set_circles(ax01, xs, 0.11, [r"$%d$"%(idx+1) for idx in range(len(xs))])
 
     # (4.1) SUBPLOT 1 - SET AXIS DETAILS
     # -- customize x-axis
@@ -336,24 +623,21 @@ def generate_figure(x, t, uxt, fig_format=None, fig_name='fig02'):
 
     # (3.2) SUBPLOT 2 - SET AXES CONTENTS
 
-    # -- trace path of 1st soliton in subfigure 1
-    x_idx = np.zeros(len(t), dtype=int)
-    a = np.zeros(len(t)); a[0]=1
-    mask = np.zeros(len(x)); mask[x<0.2]=1; mask[x>1.8]=1
-    for i in range(1,len(t)):
-       x_idx[i] = np.argmax(uxt[i]*mask)
-       a[i] = np.real(uxt[i,x_idx[i]])
-       s = np.min( [ np.abs(x_idx[i]-x_idx[i-1]), np.abs(x_idx[i]-x_idx[-1]+len(x))    ]  )
-       mask = np.roll(mask, s )
+    if trace:
+        # -- trace path of 1st soliton in subfigure 1
+        x_idx, a = trace_soliton(uxt, x)
 
-    ax02.plot(a, t, color='black')
+        ax02.plot(a, t, color='black')
 
-    # -- highlight traced path of 1st soliton in subfigure 1
-    ax01.plot(x[x_idx][::20],t[::20],color='white', linewidth=0, marker='.', markersize=2)
+        # -- highlight traced path of 1st soliton in subfigure 1
+        ax01.plot(x[x_idx][::20],t[::20],color='white', linewidth=0, marker='.', markersize=2)
 
-    # -- add auxiliary horizontal lines
-    for t0 in [0.5,1./3,1./4,1./5,1./6]:
-        ax02.axhline(y=t0, xmin=0., xmax=a[np.argmin(np.abs(t-t0))]/4.,  color='black', dashes=[2,2], linewidth=1)
+        # -- add auxiliary horizontal lines (single line collection, ending at
+        # -- the soliton amplitude a0 on the x-axis range (0,4))
+        a0s = a[closest_index(t, t0s)]          # amplitudes at all t0 in one lookup
+        segs = [[(0., t0), (a0/4., t0)] for t0, a0 in zip(t0s, a0s)]
+        ax02.add_collection(LineCollection(segs, colors='black', linestyles=(0,(2,2)), linewidths=1,
+                                           transform=ax02.get_yaxis_transform()), autolim=False)
 
 
     # (4.2) SUBPLOT 2 - SET AXIS DETAILS
@@ -386,10 +670,15 @@ def generate_figure(x, t, uxt, fig_format=None, fig_name='fig02'):
 
     # (6) SAVE FIGURE
     save_figure(fig_format, fig_name)
+    if fig_format is not None:
+        # -- free canvas buffers right away instead of relying on GC
+        plt.close(fig)
 
 
 def main():
-    x, t, uxt = fetch_data('KdV_raw_data.npz')
+    x, t, uxt = fetch_data('KdV_raw_data.npz', mmap_mode='r')
+    # -- batch mode: render off-screen, no GUI canvas/window setup
+    plt.switch_backend('Agg')
     generate_figure(x, t, uxt, fig_format='png', fig_name='fig02')
 
 